@@ -1,44 +1,280 @@
 import os
+import uuid
+import functools
+import asyncio
+import operator
+import hashlib
+import threading
+import weakref
+import atexit
+import logging
+import logging.handlers
+import queue
 import random
 import requests
-import schedule
-import time
-from typing import Dict, TypedDict, Union, List, Literal
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from typing import Annotated, Dict, TypedDict, Union, List, Literal, Optional, Type
 import json
+import diskcache
+import orjson
 from datetime import datetime
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.types import Command, Send, interrupt
+from langchain_core import exceptions as lc_exceptions
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-import smtplib
+from pydantic import BaseModel
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
+from email_utils import SMTPSession
 load_dotenv()
 
-os.getenv("google_api_key")
+# Configuration is read once at import so a missing key fails fast instead of mid-run
+API_KEY = os.getenv("API_KEY")
+GOOGLE_API_KEY = os.getenv("google_api_key") or os.getenv("GOOGLE_API_KEY")
+SENDER_EMAIL = os.getenv("SENDER_EMAIL")
+RECEIVER_EMAIL = os.getenv("RECEIVER_EMAIL")
+EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+
+_missing_env = [
+    name for name, value in [
+        ("API_KEY", API_KEY),
+        ("google_api_key", GOOGLE_API_KEY),
+        ("SENDER_EMAIL", SENDER_EMAIL),
+        ("RECEIVER_EMAIL", RECEIVER_EMAIL),
+        ("EMAIL_PASSWORD", EMAIL_PASSWORD),
+    ] if not value
+]
+if _missing_env:
+    raise RuntimeError(
+        f"Missing environment variables: {', '.join(_missing_env)}. "
+        "Set them in the environment or in a .env file (see README)."
+    )
+
+
+@functools.cache
+def get_llm() -> ChatGoogleGenerativeAI:
+    """Shared Gemini client, created on first use rather than at import"""
+    # The SDK keeps its default retries; _invoke_llm backs off further on top of them
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash", temperature=0, google_api_key=GOOGLE_API_KEY
+    )
+
+
+# Upper bound on in-flight Gemini and OpenWeather requests
+MAX_CONCURRENT_REQUESTS = 8
+# Rate limiting and server-side failures, worth retrying with backoff
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+_llm_slots = weakref.WeakKeyDictionary()
+_weather_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+# Exact-match cache for LLM answers, persisted across restarts
+LLM_CACHE_TTL = 60 * 60
+
+
+@functools.cache
+def _llm_cache() -> diskcache.Cache:
+    return diskcache.Cache("./.llm_cache")
+
+
+@functools.cache
+def _http() -> requests.Session:
+    """Shared HTTP session so weather lookups reuse pooled keep-alive connections"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=RETRYABLE_STATUS)
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Disaster records are written by a background listener so graph runs never wait on disk IO.
+# A rotating file must have a single writer, so when several processes run (e.g. web
+# workers) DISASTER_LOG_FILE can contain "{pid}" to give each process its own file
+DISASTER_LOG_FILE = os.getenv("DISASTER_LOG_FILE", "disaster_log.jsonl").format(pid=os.getpid())
+_log_queue = queue.Queue()
+_log_file_handler = logging.handlers.RotatingFileHandler(
+    DISASTER_LOG_FILE, maxBytes=5_000_000, backupCount=5, encoding="utf-8", delay=True
+)
+_log_file_handler.setFormatter(logging.Formatter("%(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_file_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+disaster_logger = logging.getLogger("weather.disaster_log")
+disaster_logger.setLevel(logging.INFO)
+disaster_logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+disaster_logger.propagate = False
+
+
+def dump_log_record(record: Dict) -> str:
+    """Encode a log record as compact JSON"""
+    return orjson.dumps(record, default=str).decode()
+
+
+class Analysis(BaseModel):
+    """Disaster classification and severity returned by a single LLM call"""
+    disaster_type: Literal["Hurricane", "Flood", "Heatwave", "Severe Storm", "Winter Storm", "No Immediate Threat"]
+    severity: Literal["Critical", "High", "Medium", "Low"]
+
+
+# Analysis values are validated enums, so routing compares them exactly
+HUMAN_REVIEW_SEVERITIES = ("Low", "Medium")
+
+# Department drafting the plan for each disaster type; anything else goes to civil defense
+_ROUTES = {
+    "Flood": "public_works_response",
+    "Severe Storm": "public_works_response",
+    "Winter Storm": "public_works_response",
+}
 
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
 
 class WeatherState(TypedDict):
     city: str
     weather_data: Dict
     disaster_type: str
     severity: str
-    response: str
-    messages: List[Union[SystemMessage, HumanMessage, AIMessage]]
+    responses: Annotated[List[str], operator.add]
+    messages: Annotated[List[Union[SystemMessage, HumanMessage, AIMessage]], add_messages]
     alerts: List[str]
     human_approved: bool
+    email_sent: bool
+
+
+# The analysis prompt is built once at import; its chain on first use
+ANALYZE_PROMPT = ChatPromptTemplate.from_template(
+    "Based on the following weather conditions, identify if there's a potential weather disaster "
+    "and assess its severity.\n"
+    "Weather conditions:\n"
+    "- Description: {weather}\n"
+    "- Wind Speed: {wind_speed} m/s\n"
+    "- Temperature: {temperature}°C\n"
+    "- Humidity: {humidity}%\n"
+    "- Pressure: {pressure} hPa\n"
+    "Categorize into one of these types: Hurricane, Flood, Heatwave, Severe Storm, Winter Storm, or No Immediate Threat.\n"
+    "Rate the severity as either 'Critical', 'High', 'Medium', or 'Low'."
+)
+
+
+@functools.cache
+def get_analyze_chain() -> Runnable:
+    return ANALYZE_PROMPT | get_llm().with_structured_output(Analysis)
+
+
+# Response-plan prompts are single user messages, so plain str.format is enough
+EMERGENCY_PROMPT = (
+    "Create an emergency response plan for a {disaster_type} situation "
+    "with {severity} severity level in {city}. Include immediate actions needed."
+)
+CIVIL_DEFENSE_PROMPT = (
+    "Create a civil defense response plan for a {disaster_type} situation "
+    "with {severity} severity level in {city}. Focus on public safety measures."
+)
+PUBLIC_WORKS_PROMPT = (
+    "Create a public works response plan for a {disaster_type} situation "
+    "with {severity} severity level in {city}. Focus on infrastructure protection."
+)
+
+
+def bucket_weather(weather_data: Dict) -> Dict:
+    """Round weather readings so near-identical conditions share a cache entry"""
+    def numeric(value):
+        return isinstance(value, (int, float))
+
+    bucketed = dict(weather_data)
+    if numeric(bucketed.get("temperature")):
+        bucketed["temperature"] = round(bucketed["temperature"])
+    if numeric(bucketed.get("wind_speed")):
+        bucketed["wind_speed"] = round(bucketed["wind_speed"], 1)
+    for key in ("humidity", "pressure"):
+        if numeric(bucketed.get(key)):
+            bucketed[key] = 5 * round(bucketed[key] / 5)
+    return bucketed
+
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    """Semaphore limiting concurrent LLM requests on the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _llm_slots:
+        _llm_slots[loop] = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    return _llm_slots[loop]
+
+
+# Rate-limit error raised by newer langchain integrations; older langchain-core lacks it
+_MODEL_RATE_LIMIT_ERROR = getattr(lc_exceptions, "ModelRateLimitError", ())
+
+
+def _is_transient_llm_error(exc: BaseException) -> bool:
+    """Retry only throttling, 5xx and timeouts
+
+    langchain-google-genai wraps the Gemini API error, so the HTTP status is
+    looked up on the exception itself and on its cause.
+    """
+    if isinstance(exc, (_MODEL_RATE_LIMIT_ERROR, asyncio.TimeoutError)):
+        return True
+    return any(
+        getattr(err, "code", None) in RETRYABLE_STATUS for err in (exc, exc.__cause__)
+    )
+
+
+@retry(
+    wait=wait_exponential_jitter(initial=0.5, max=8),
+    stop=stop_after_attempt(4),
+    retry=retry_if_exception(_is_transient_llm_error),
+    reraise=True
+)
+async def _invoke_llm(chain: Runnable, payload):
+    return await chain.ainvoke(payload)
+
+
+async def cached_llm_call(node: str, chain: Runnable, inputs: Dict,
+                          schema: Optional[Type[BaseModel]] = None,
+                          prompt: Optional[str] = None):
+    """Invoke an LLM chain, reusing the stored answer when its inputs match exactly.
+
+    `inputs` should hold just the prompt variables so they form the cache key.
+    When a plain `prompt` string is given it is formatted with them and sent to
+    `chain` as a single HumanMessage instead.
+    Returns the response text, or an instance of `schema` for structured-output chains.
+    """
+    key = hashlib.blake2b(
+        json.dumps([node, inputs], sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+    # diskcache does blocking SQLite I/O (and may wait on other processes' locks),
+    # so keep it off the event loop
+    cached = await asyncio.to_thread(lambda: _llm_cache().get(key))
+    if cached is None:
+        async with _llm_semaphore():
+            if prompt is None:
+                result = await _invoke_llm(chain, inputs)
+            else:
+                result = await _invoke_llm(chain, [HumanMessage(content=prompt.format(**inputs))])
+        cached = result.content if schema is None else result.model_dump()
+        await asyncio.to_thread(lambda: _llm_cache().set(key, cached, expire=LLM_CACHE_TTL))
+
+    return cached if schema is None else schema(**cached)
 
 
 def get_weather_data(state: WeatherState) -> Dict:
     """Fetch weather data from OpenWeatherMap API"""
     BASE_URL = "http://api.openweathermap.org/data/2.5/weather"
-    API_KEY = os.getenv("API_KEY")
 
-    request_url = f"{BASE_URL}?appid={API_KEY}&q={state['city']}"
     try:
-        response = requests.get(request_url)
+        with _weather_slots:
+            response = _http().get(BASE_URL, params={"appid": API_KEY, "q": state["city"]}, timeout=(3, 10))
         response.raise_for_status()
 
         data = response.json()
@@ -53,9 +289,8 @@ def get_weather_data(state: WeatherState) -> Dict:
         }
 
         return {
-            **state,
             "weather_data": weather_data,
-            "messages": state["messages"] + [SystemMessage(content=f"Weather data fetched successfully for {state['city']}")]
+            "messages": [SystemMessage(content=f"Weather data fetched successfully for {state['city']}")]
         }
 
     except Exception as e:
@@ -69,267 +304,183 @@ def get_weather_data(state: WeatherState) -> Dict:
             "pressure": "N/A"
         }
         return {
-            **state,
             "weather_data": error_data,
-            "messages": state["messages"] + [SystemMessage(content=f"Failed to fetch weather data for {state['city']}: {str(e)}")]
+            "messages": [SystemMessage(content=f"Failed to fetch weather data for {state['city']}: {str(e)}")]
         }
 
 
-def analyze_disaster_type(state: WeatherState) -> WeatherState:
-    """Analyze weather data to identify potential disasters"""
-    weather_data = state["weather_data"]
-    prompt = ChatPromptTemplate.from_template(
-        "Based on the following weather conditions, identify if there's a potential weather disaster.\n"
-        "Weather conditions:\n"
-        "- Description: {weather}\n"
-        "- Wind Speed: {wind_speed} m/s\n"
-        "- Temperature: {temperature}°C\n"
-        "- Humidity: {humidity}%\n"
-        "- Pressure: {pressure} hPa\n"
-        "Categorize into one of these types: Hurricane, Flood, Heatwave, Severe Storm, Winter Storm, or No Immediate Threat"
-    )
-
+async def analyze_all(state: WeatherState) -> WeatherState:
+    """Identify the potential disaster and assess its severity in one LLM call"""
+    weather_data = bucket_weather(state["weather_data"])
     try:
-        chain = prompt | llm
-        disaster_type = chain.invoke(weather_data).content
+        analysis = await cached_llm_call(
+            "analyze_all", get_analyze_chain(),
+            {name: weather_data[name] for name in ANALYZE_PROMPT.input_variables},
+            schema=Analysis
+        )
         return {
-            **state,
-            "disaster_type": disaster_type,
-            "messages": state["messages"] + [SystemMessage(content=f"Disaster type identified: {disaster_type}")]
+            "disaster_type": analysis.disaster_type,
+            "severity": analysis.severity,
+            "messages": [
+                SystemMessage(content=f"Disaster type identified: {analysis.disaster_type}"),
+                SystemMessage(content=f"Severity assessed as: {analysis.severity}")
+            ]
         }
     except Exception as e:
         return {
-            **state,
             "disaster_type": "Analysis Failed",
-            "messages": state["messages"] + [SystemMessage(content=f"Failed to analyze disaster type: {str(e)}")]
+            "severity": "Assessment Failed",
+            "messages": [SystemMessage(content=f"Failed to analyze weather conditions: {str(e)}")]
         }
-    
-
-def assess_severity(state: WeatherState) -> WeatherState:
-    """Assess the severity of the identified weather situation"""
-    weather_data = state["weather_data"]
-    prompt = ChatPromptTemplate.from_template(
-        "Given the weather conditions and identified disaster type '{disaster_type}', "
-        "assess the severity level. Consider:\n"
-        "- Weather: {weather}\n"
-        "- Wind Speed: {wind_speed} m/s\n"
-        "- Temperature: {temperature}°C\n"
-        "Respond with either 'Critical', 'High', 'Medium', or 'Low'"
-    )
 
-    try:
-        chain = prompt | llm
-        severity = chain.invoke({
-            **weather_data,
-            "disaster_type": state["disaster_type"]
-        }).content
 
-        return {
-            **state,
-            "severity": severity,
-            "messages": state["messages"] + [SystemMessage(content=f"Severity assessed as: {severity}")]
-        }
-    except Exception as e:
-        return {
-            **state,
-            "severity": "Assessment Failed",
-            "messages": state["messages"] + [SystemMessage(content=f"Failed to assess severity: {str(e)}")]
-        }    
-    
-
-def emergency_response(state: WeatherState) -> WeatherState:
+async def emergency_response(state: WeatherState) -> WeatherState:
     """Generate emergency response plan"""
-    prompt = ChatPromptTemplate.from_template(
-        "Create an emergency response plan for a {disaster_type} situation "
-        "with {severity} severity level in {city}. Include immediate actions needed."
-    )
     try:
-        chain = prompt | llm
-        response = chain.invoke({
+        response = await cached_llm_call("emergency_response", get_llm(), {
             "disaster_type": state["disaster_type"],
             "severity": state["severity"],
             "city": state["city"]
-        }).content
+        }, prompt=EMERGENCY_PROMPT)
 
         return {
-            **state,
-            "response": response,
-            "messages": state["messages"] + [SystemMessage(content="Emergency response plan generated")]
+            "responses": [response],
+            "messages": [SystemMessage(content="Emergency response plan generated")]
         }
     except Exception as e:
         return {
-            **state,
-            "response": "Failed to generate response plan",
-            "messages": state["messages"] + [SystemMessage(content=f"Failed to generate emergency response: {str(e)}")]
+            "responses": ["Failed to generate response plan"],
+            "messages": [SystemMessage(content=f"Failed to generate emergency response: {str(e)}")]
         }    
     
 
-def civil_defense_response(state: WeatherState) -> WeatherState:
+async def civil_defense_response(state: WeatherState) -> WeatherState:
     """Generate civil defense response plan"""
-    prompt = ChatPromptTemplate.from_template(
-        "Create a civil defense response plan for a {disaster_type} situation "
-        "with {severity} severity level in {city}. Focus on public safety measures."
-    )
     try:
-        chain = prompt | llm
-        response = chain.invoke({
+        response = await cached_llm_call("civil_defense_response", get_llm(), {
             "disaster_type": state["disaster_type"],
             "severity": state["severity"],
             "city": state["city"]
-        }).content
+        }, prompt=CIVIL_DEFENSE_PROMPT)
 
         return {
-            **state,
-            "response": response,
-            "messages": state["messages"] + [SystemMessage(content="Civil defense response plan generated")]
+            "responses": [response],
+            "messages": [SystemMessage(content="Civil defense response plan generated")]
         }
     except Exception as e:
         return {
-            **state,
-            "response": "Failed to generate response plan",
-            "messages": state["messages"] + [SystemMessage(content=f"Failed to generate civil defense response: {str(e)}")]
+            "responses": ["Failed to generate response plan"],
+            "messages": [SystemMessage(content=f"Failed to generate civil defense response: {str(e)}")]
         }
 
 
-def public_works_response(state: WeatherState) -> WeatherState:
+async def public_works_response(state: WeatherState) -> WeatherState:
     """Generate public works response plan"""
-    prompt = ChatPromptTemplate.from_template(
-        "Create a public works response plan for a {disaster_type} situation "
-        "with {severity} severity level in {city}. Focus on infrastructure protection."
-    )
     try:
-        chain = prompt | llm
-        response = chain.invoke({
+        response = await cached_llm_call("public_works_response", get_llm(), {
             "disaster_type": state["disaster_type"],
             "severity": state["severity"],
             "city": state["city"]
-        }).content
+        }, prompt=PUBLIC_WORKS_PROMPT)
 
         return {
-            **state,
-            "response": response,
-            "messages": state["messages"] + [SystemMessage(content="Public works response plan generated")]
+            "responses": [response],
+            "messages": [SystemMessage(content="Public works response plan generated")]
         }
     except Exception as e:
         return {
-            **state,
-            "response": "Failed to generate response plan",
-            "messages": state["messages"] + [SystemMessage(content=f"Failed to generate public works response: {str(e)}")]
+            "responses": ["Failed to generate response plan"],
+            "messages": [SystemMessage(content=f"Failed to generate public works response: {str(e)}")]
         }
 
 def data_logging(state: WeatherState) -> WeatherState:
-    """Log weather data, disaster analysis, and response to a file."""
+    """Queue weather data, disaster analysis, and response for the JSONL log file."""
     log_data = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
         "city": state["city"],
         "weather_data": state["weather_data"],
         "disaster_type": state["disaster_type"],
         "severity": state["severity"],
-        "response": state["response"],
+        "responses": state["responses"],
     }
 
     try:
-        with open("disaster_log.txt", "a") as log_file:
-            log_file.write(json.dumps(log_data) + "\n")
+        disaster_logger.info(dump_log_record(log_data))
 
         return {
-            **state,
-            "messages": state["messages"] + [SystemMessage(content="Data logged successfully")]
+            "messages": [SystemMessage(content="Data logged successfully")]
         }
     except Exception as e:
         return {
-            **state,
-            "messages": state["messages"] + [SystemMessage(content=f"Failed to log data: {str(e)}")]
+            "messages": [SystemMessage(content=f"Failed to log data: {str(e)}")]
         }
 
 
 def get_human_verification(state: WeatherState) -> WeatherState:
-    """Get human verification for low/medium severity alerts"""
-    severity = state["severity"].strip().lower()
-
-    if severity in ["low", "medium"]:
-        print("\n" + "="*50)
-        print(f"Low/Medium severity alert for {state['city']} requires human approval:")
-        print(f"Disaster Type: {state['disaster_type']}")
-        print(f"Current Weather: {state['weather_data']['weather']}")
-        print(f"Temperature: {state['weather_data']['temperature']}°C")
-        print(f"Wind Speed: {state['weather_data']['wind_speed']} m/s")
-        print(f"Severity: {state['severity']}")
-        print(f"Response Plan: {state['response']}")
-        print("\nType 'y' to approve sending alert or 'n' to reject (waiting for input):")
-        print("="*50)
-
-        # Block and wait for input
-        while True:
-            try:
-                user_input = input().lower().strip()
-                if user_input in ['y', 'n']:
-                    approved = user_input == 'y'
-                    print(f"Human verification result: {'Approved' if approved else 'Rejected'}")
-                    break
-                else:
-                    print("Please enter 'y' for yes or 'n' for no:")
-            except Exception as e:
-                print(f"Error reading input: {str(e)}")
-                print("Please try again with 'y' or 'n':")
+    """Get human verification for low/medium severity alerts.
+
+    The run is paused with `interrupt` instead of blocking on input, so other
+    cities keep running; the operator's decision arrives as the resume value.
+    """
+    if state["severity"] in HUMAN_REVIEW_SEVERITIES:
+        approved = bool(interrupt({
+            "city": state["city"],
+            "disaster_type": state["disaster_type"],
+            "severity": state["severity"],
+            "weather_data": state["weather_data"],
+            "response_plan": format_response_plan(state)
+        }))
+        print(f"Human verification result: {'Approved' if approved else 'Rejected'}")
 
         return {
-            **state,
             "human_approved": approved,
-            "messages": state["messages"] + [
+            "messages": [
                 SystemMessage(content=f"Human verification: {'Approved' if approved else 'Rejected'}")
             ]
         }
     else:
         # Auto-approve for high/critical severity
         return {
-            **state,
             "human_approved": True,
-            "messages": state["messages"] + [
-                SystemMessage(content=f"Auto-approved {severity} severity alert")
+            "messages": [
+                SystemMessage(content=f"Auto-approved {state['severity']} severity alert")
             ]
         }
     
 
+# SMTP connection kept open between alerts
+_smtp = SMTPSession()
+atexit.register(_smtp.close)
+
+
 def send_email_alert(state: WeatherState) -> WeatherState:
     """Send weather alert email"""
-    sender_email = os.getenv("SENDER_EMAIL")
-    receiver_email = os.getenv("RECEIVER_EMAIL")
-    password = os.getenv("EMAIL_PASSWORD")
-
     msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = receiver_email
+    msg['From'] = SENDER_EMAIL
+    msg['To'] = RECEIVER_EMAIL
     msg['Subject'] = f"Weather Alert: {state['severity']} severity weather event in {state['city']}"
 
     body = format_weather_email(state)
     msg.attach(MIMEText(body, 'plain'))
 
     try:
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(sender_email, password)
-        text = msg.as_string()
-        server.sendmail(sender_email, receiver_email, text)
-        server.quit()
+        _smtp.sendmail(SENDER_EMAIL, EMAIL_PASSWORD, RECEIVER_EMAIL, msg.as_string())
 
         # Add confirmation message
-        severity = state["severity"].strip().lower()
-        if severity in ["low", "medium"]:
-            print(f"\nVerification was approved by human, Email sent to {receiver_email} successfully")
+        if state["severity"] in HUMAN_REVIEW_SEVERITIES:
+            print(f"\nVerification was approved by human, Email sent to {RECEIVER_EMAIL} successfully")
         else:
             print("\nEmail sent successfully for high severity alert")
 
         return {
-            **state,
-            "messages": state["messages"] + [SystemMessage(content=f"Successfully sent weather alert email for {state['city']}")],
-            "alerts": state["alerts"] + [f"Email alert sent: {datetime.now()}"]
+            "messages": [SystemMessage(content=f"Successfully sent weather alert email for {state['city']}")],
+            "alerts": state["alerts"] + [f"Email alert sent: {datetime.now()}"],
+            "email_sent": True
         }
 
     except Exception as e:
         return {
-            **state,
-            "messages": state["messages"] + [SystemMessage(content=f"Failed to send email alert: {str(e)}")]
+            "messages": [SystemMessage(content=f"Failed to send email alert: {str(e)}")]
         } 
 
 
@@ -343,29 +494,38 @@ def handle_no_approval(state: WeatherState) -> WeatherState:
         f"by human operator and verification was rejected."
     )
     return {
-        **state,
-        "messages": state["messages"] + [SystemMessage(content=message)]
+        "messages": [SystemMessage(content=message)]
     }
 
-def route_response(state: WeatherState) -> Literal["emergency_response", "send_email_alert", "civil_defense_response", "public_works_response"]:
-    """Route to appropriate department based on disaster type and severity"""
-    disaster = state["disaster_type"].strip().lower()
-    severity = state["severity"].strip().lower()
+def route_response(state: WeatherState) -> List[Send]:
+    """Dispatch to the departments that should draft a response plan.
 
-    if severity in ["critical", "high"]:
-        return "emergency_response"
-        "send_email_alert"
-    elif "flood" in disaster or "storm" in disaster:
-        return "public_works_response"
+    Critical alerts fan out to the emergency team and the relevant department
+    at once; the plans are generated in parallel and merged into `responses`.
+    """
+    severity = state["severity"]
+    department = _ROUTES.get(state["disaster_type"], "civil_defense_response")
+
+    if severity == "Critical":
+        targets = ["emergency_response", department]
+    elif severity == "High":
+        targets = ["emergency_response"]
     else:
-        return "civil_defense_response"
-    
+        targets = [department]
+
+    return [Send(target, state) for target in targets]
+
 
 def verify_approval_router(state: WeatherState) -> Literal["send_email_alert", "handle_no_approval"]:
     """Route based on human approval decision"""
     return "send_email_alert" if state['human_approved'] else "handle_no_approval"
 
 
+def format_response_plan(state: WeatherState) -> str:
+    """Join the response plans drafted by each department into one text"""
+    return "\n\n".join(state.get("responses", []))
+
+
 def format_weather_email(state: WeatherState) -> str:
     """Format weather data and severity assessment into an email message"""
     weather_data = state["weather_data"]
@@ -385,104 +545,279 @@ Current Weather Conditions:
 - Cloud Cover: {weather_data['cloud_cover']}%
 
 Response Plan:
-{state['response']}
+{format_response_plan(state)}
 
 This is an automated weather alert generated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 """
 
-    if state['severity'].lower() in ['low', 'medium']:
+    if state['severity'] in HUMAN_REVIEW_SEVERITIES:
         email_content += "\nNote: This low/medium severity alert has been verified by a human operator."
 
     return email_content
 
 
-# Create the workflow
-workflow = StateGraph(WeatherState)
+def _build_workflow() -> StateGraph:
+    """Assemble the weather emergency graph; compile it with or without a checkpointer"""
+    workflow = StateGraph(WeatherState)
 
-# Add nodes
-workflow.add_node("get_weather", get_weather_data)
-workflow.add_node("analyze_disaster", analyze_disaster_type)
-workflow.add_node("assess_severity", assess_severity)
-workflow.add_node("data_logging", data_logging)
-workflow.add_node("emergency_response", emergency_response)
-workflow.add_node("civil_defense_response", civil_defense_response)
-workflow.add_node("public_works_response", public_works_response)
-workflow.add_node("get_human_verification", get_human_verification)
-workflow.add_node("send_email_alert", send_email_alert)
-workflow.add_node("handle_no_approval", handle_no_approval)
+    # Add nodes
+    workflow.add_node("get_weather", get_weather_data)
+    workflow.add_node("analyze", analyze_all)
+    workflow.add_node("data_logging", data_logging)
+    workflow.add_node("emergency_response", emergency_response)
+    workflow.add_node("civil_defense_response", civil_defense_response)
+    workflow.add_node("public_works_response", public_works_response)
+    workflow.add_node("get_human_verification", get_human_verification)
+    workflow.add_node("send_email_alert", send_email_alert)
+    workflow.add_node("handle_no_approval", handle_no_approval)
 
-# Add edges
-workflow.add_edge("get_weather","analyze_disaster" )
-workflow.add_edge("analyze_disaster", "assess_severity")
-workflow.add_edge("assess_severity", "data_logging")
-workflow.add_conditional_edges("data_logging", route_response)
-workflow.add_edge("civil_defense_response", "get_human_verification")
-workflow.add_edge("public_works_response", "get_human_verification")
-workflow.add_conditional_edges("get_human_verification", verify_approval_router)
-workflow.add_edge("emergency_response", "send_email_alert")
-workflow.add_edge("send_email_alert", END)
-workflow.add_edge("handle_no_approval", END)
+    # Add edges
+    workflow.add_edge("get_weather", "analyze")
+    workflow.add_edge("analyze", "data_logging")
+    workflow.add_conditional_edges("data_logging", route_response)
+    workflow.add_edge("civil_defense_response", "get_human_verification")
+    workflow.add_edge("public_works_response", "get_human_verification")
+    workflow.add_edge("emergency_response", "get_human_verification")
+    workflow.add_conditional_edges("get_human_verification", verify_approval_router)
+    workflow.add_edge("send_email_alert", END)
+    workflow.add_edge("handle_no_approval", END)
 
-workflow.set_entry_point("get_weather")
+    workflow.set_entry_point("get_weather")
+    return workflow
 
-# Compile the workflow
-app = workflow.compile()
 
+@functools.cache
+def get_app():
+    """Graph for one-off checks, compiled on first use.
 
-def run_weather_emergency_system(city: str):
-    """Initialize and run the weather emergency system for a given city"""
-    initial_state = {
+    Runs are only kept in memory, just long enough to pause for approval.
+    """
+    return _build_workflow().compile(checkpointer=InMemorySaver())
+
+
+# Scheduled monitoring keeps one checkpointed thread per city in this database
+CHECKPOINT_DB = "state.db"
+
+
+def initial_state_for(city: str) -> WeatherState:
+    """Build the starting state of a weather check for the given city"""
+    return {
         "city": city,
         "weather_data": {},
         "disaster_type": "",
         "severity": "",
-        "response": "",
+        "responses": [],
         "messages": [],
         "alerts": [],
         "social_media_reports": [],
-        "human_approved": False
+        "human_approved": False,
+        "email_sent": False
     }
 
+
+async def run_weather_emergency_system_async(city: str):
+    """Initialize and run the weather emergency system for a given city
+
+    Low/medium alerts pause for approval, which is asked for on the console
+    before the run continues.
+    """
+    app = get_app()
+    config = {"configurable": {"thread_id": uuid.uuid4().hex}}
     try:
-        result = app.invoke(initial_state)
+        result = await app.ainvoke(initial_state_for(city), config)
+        if result.get("__interrupt__"):
+            print_approval_request(city, result["__interrupt__"][0].value)
+            approved = await ask_approval_async()
+            result = await app.ainvoke(Command(resume=approved), config)
         print(f"Completed weather check for {city}")
         return result
     except Exception as e:
         print(f"Error running weather emergency system: {str(e)}")
+    finally:
+        await app.checkpointer.adelete_thread(config["configurable"]["thread_id"])
 
 
-def main():
-    """Main function to run the weather emergency system"""
-    
-    def scheduled_check():
-        """Function to perform scheduled checks for multiple cities"""
-        # cities = ['London', 'karachi'] # Add more cities as needed
-        cities = input("\nEnter cities to monitor (comma-separated), or  default (London, Karachi): ")
-        print(f"\nStarting scheduled check at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-
-        for city in cities:
-            try:
-                print(f"\nChecking weather conditions for {city}...")
-                run_weather_emergency_system(city)
-                time.sleep(2)  # Brief pause between cities
-            except Exception as e:
-                print(f"Error checking {city}: {str(e)}")
-
-    # Schedule checks every hour
-    schedule.every(1).minute.do(scheduled_check)
-    print("Weather Emergency Response System started.")
-    print("Monitoring scheduled for every minute.")
+def run_weather_emergency_system(city: str):
+    """Synchronous wrapper around run_weather_emergency_system_async"""
+    return asyncio.run(run_weather_emergency_system_async(city))
+
+
+DEFAULT_CITIES = ["London", "Karachi"]
+
 
+def parse_cities(raw: str) -> List[str]:
+    """Split comma-separated city input, dropping blanks and duplicates"""
+    cities = [city.strip() for city in raw.split(",") if city.strip()]
+    return list(dict.fromkeys(cities)) or list(DEFAULT_CITIES)
+
+
+# Cities whose check is still running, so overlapping ticks don't run them twice
+_active_cities = set()
+
+# Runs paused for operator approval, answered one at a time from the console
+_awaiting_approval = set()
+_approval_queue = asyncio.Queue()
+
+
+async def check_cities(cities: List[str], graph):
+    """Run the weather emergency system for several cities as one batch.
+
+    With a checkpointed graph each city keeps its own rolling thread: a run left
+    unfinished (e.g. by a restart) resumes from its last checkpoint instead of
+    fetching and analyzing the weather again, otherwise the old run is cleared
+    and a fresh check starts.
+    """
+    for city in cities:
+        if city in _active_cities:
+            print(f"\nPrevious check for {city} is still running, skipping")
+        elif city in _awaiting_approval:
+            print(f"\nCheck for {city} is still waiting for human approval, skipping")
+    cities = [city for city in cities if city not in _active_cities | _awaiting_approval]
+    if not cities:
+        return []
+
+    max_concurrency = min(len(cities), MAX_CONCURRENT_REQUESTS)
+    inputs = [initial_state_for(city) for city in cities]
+    if graph.checkpointer is None:
+        configs = {"max_concurrency": max_concurrency}
+    else:
+        configs = [
+            {"configurable": {"thread_id": city}, "max_concurrency": max_concurrency}
+            for city in cities
+        ]
+        for index, config in enumerate(configs):
+            if (await graph.aget_state(config)).next:
+                inputs[index] = None
+            else:
+                await graph.checkpointer.adelete_thread(cities[index])
+
+    for city, state in zip(cities, inputs):
+        action = "Resuming unfinished check" if state is None else "Checking weather conditions"
+        print(f"\n{action} for {city}...")
+
+    _active_cities.update(cities)
+    try:
+        results = await graph.abatch(inputs, configs, return_exceptions=True)
+    finally:
+        _active_cities.difference_update(cities)
+
+    for city, result in zip(cities, results):
+        if isinstance(result, Exception):
+            print(f"Error checking {city}: {str(result)}")
+        elif result.get("__interrupt__") and graph.checkpointer is not None:
+            _awaiting_approval.add(city)
+            _approval_queue.put_nowait((city, result["__interrupt__"][0].value))
+            print(f"Weather check for {city} is waiting for human approval")
+        else:
+            print(f"Completed weather check for {city}")
+    return results
+
+
+def ask_approval() -> bool:
+    """Block until the operator types 'y' or 'n'"""
     while True:
         try:
-            schedule.run_pending()
-            time.sleep(1)
-        except KeyboardInterrupt:
-            print("\nShutting down Weather Emergency Response System...")
-            break
+            user_input = input().lower().strip()
+            if user_input in ['y', 'n']:
+                return user_input == 'y'
+            print("Please enter 'y' for yes or 'n' for no:")
         except Exception as e:
-            print(f"Error in main loop: {str(e)}")
-            time.sleep(1)
+            print(f"Error reading input: {str(e)}")
+            print("Please try again with 'y' or 'n':")
+
+
+async def ask_approval_async() -> bool:
+    """Wait for ask_approval without tying up the event loop's executor
+
+    The prompt runs on a daemon thread, so Ctrl+C while it waits on input()
+    shuts the loop down instead of hanging on the blocked thread.
+    """
+    loop = asyncio.get_running_loop()
+    answer = loop.create_future()
+
+    def resolve(approved: bool):
+        if not answer.done():
+            answer.set_result(approved)
+
+    def prompt():
+        approved = ask_approval()
+        try:
+            loop.call_soon_threadsafe(resolve, approved)
+        except RuntimeError:
+            pass  # Loop already closed; nobody is waiting for the answer
+
+    threading.Thread(target=prompt, name="approval-prompt", daemon=True).start()
+    return await answer
+
+
+def print_approval_request(city: str, details: Dict):
+    """Show the operator a paused low/medium alert awaiting their decision"""
+    weather_data = details["weather_data"]
+
+    print("\n" + "="*50)
+    print(f"Low/Medium severity alert for {city} requires human approval:")
+    print(f"Disaster Type: {details['disaster_type']}")
+    print(f"Current Weather: {weather_data['weather']}")
+    print(f"Temperature: {weather_data['temperature']}°C")
+    print(f"Wind Speed: {weather_data['wind_speed']} m/s")
+    print(f"Severity: {details['severity']}")
+    print(f"Response Plan: {details['response_plan']}")
+    print("\nType 'y' to approve sending alert or 'n' to reject (waiting for input):")
+    print("="*50)
+
+
+async def approval_worker(graph):
+    """Ask the operator about paused low/medium alerts and resume their runs"""
+    while True:
+        city, details = await _approval_queue.get()
+        print_approval_request(city, details)
+
+        approved = await ask_approval_async()
+        try:
+            await graph.ainvoke(Command(resume=approved), {"configurable": {"thread_id": city}})
+            print(f"Completed weather check for {city}")
+        except Exception as e:
+            print(f"Error resuming weather check for {city}: {str(e)}")
+        finally:
+            _awaiting_approval.discard(city)
+
+
+async def scheduled_check_async(cities: List[str], graph):
+    """Perform a scheduled check for the monitored cities"""
+    print(f"\nStarting scheduled check at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    await check_cities(cities, graph)
+
+
+async def run_scheduler(cities: List[str]):
+    """Run scheduled checks on the event loop until cancelled"""
+    async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB) as memory:
+        monitor = _build_workflow().compile(checkpointer=memory)
+
+        scheduler = AsyncIOScheduler()
+        scheduler.add_job(
+            scheduled_check_async, "interval", minutes=1,
+            args=[cities, monitor], max_instances=3, coalesce=True
+        )
+        scheduler.start()
+        approvals = asyncio.create_task(approval_worker(monitor))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            approvals.cancel()
+            scheduler.shutdown(wait=False)
+
+
+def main():
+    """Main function to run the weather emergency system"""
+    cities = parse_cities(input("\nEnter cities to monitor (comma-separated), or  default (London, Karachi): "))
+
+    print("Weather Emergency Response System started.")
+    print(f"Monitoring {', '.join(cities)} every minute.")
+
+    try:
+        asyncio.run(run_scheduler(cities))
+    except KeyboardInterrupt:
+        print("\nShutting down Weather Emergency Response System...")
 
 if __name__ == "__main__":
     main()        
\ No newline at end of file
@@ -18,10 +18,10 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 try:
     # Import the existing agent from Agents.py
-    from Agents import run_weather_emergency_system
-except ImportError:
+    from Agents import run_weather_emergency_system, format_response_plan
+except (ImportError, RuntimeError) as e:
     # Fallback to placeholder if import fails
-    print("Warning: Could not import Agents.py. Using placeholder function.")
+    print(f"Warning: Could not import Agents.py ({e}). Using placeholder function.")
     run_weather_emergency_system = None
 
 
@@ -56,7 +56,7 @@ def run_agent(city: str) -> Dict[str, Any]:
                 "weather_data": result.get("weather_data", {}),
                 "disaster_type": result.get("disaster_type", "No Immediate Threat"),
                 "severity": result.get("severity", "Low"),
-                "response": result.get("response", "No response plan generated"),
+                "response": format_response_plan(result) or "No response plan generated",
                 "messages": [str(msg) for msg in result.get("messages", [])],
                 "alerts": result.get("alerts", [])
             }
@@ -80,7 +80,8 @@ def run_agent(city: str) -> Dict[str, Any]:
             "severity": "Unknown",
             "response": f"Error occurred during analysis: {str(e)}",
             "messages": [],
-            "alerts": []
+            "alerts": [],
+            "error": str(e)
         }
 
 
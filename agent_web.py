@@ -5,10 +5,22 @@ This module provides a web-compatible interface to the LangGraph agent.
 It handles human verification through the GUI instead of blocking terminal input.
 """
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, AsyncContextManager
 import sys
 import os
+import uuid
+import time
+import asyncio
+import atexit
+import queue
+import logging
+import logging.handlers
+from datetime import datetime, timedelta, timezone
+import aiosqlite
+from cachetools import TTLCache
 from langgraph.graph import StateGraph, END
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.types import Command, interrupt
 from langchain_core.messages import SystemMessage
 
 # Add current directory to path to import Agents module
@@ -17,78 +29,268 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 try:
     # Import necessary functions from Agents.py
     from Agents import (
-        WeatherState, get_weather_data, analyze_disaster_type, 
-        assess_severity, data_logging, emergency_response,
+        WeatherState, get_weather_data, analyze_all,
+        data_logging, emergency_response,
         civil_defense_response, public_works_response,
         send_email_alert, handle_no_approval, route_response,
-        verify_approval_router
+        verify_approval_router, format_response_plan,
+        HUMAN_REVIEW_SEVERITIES
     )
-except ImportError as e:
+except (ImportError, RuntimeError) as e:
     print(f"Warning: Could not import from Agents.py: {e}")
     # Will use placeholder if import fails
     WeatherState = None
 
 
-# Store pending verifications (in production, use a proper cache/database)
-_pending_verifications = {}
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted so tracebacks are rendered by the listener thread"""
 
+    def prepare(self, record):
+        return record
 
-def wait_for_approval(state: WeatherState) -> WeatherState:
-    """
-    Placeholder node that just returns the state when waiting for approval.
-    This allows the workflow to stop here.
-    """
-    return state
 
+class _RateLimitFilter(logging.Filter):
+    """Drop repeats of the same exception within `interval` seconds, e.g. during an outage"""
 
-def verify_approval_router_web(state: WeatherState):
-    """
-    Web-friendly router that handles pending approvals.
-    If approval is pending (None), route to wait_for_approval to stop execution.
+    def __init__(self, interval: float = 1.0):
+        super().__init__()
+        self._recent = TTLCache(maxsize=1024, ttl=interval)
+
+    def filter(self, record):
+        if not record.exc_info:
+            return True
+        exc = record.exc_info[1]
+        key = (record.msg, type(exc), str(exc))
+        if key in self._recent:
+            return False
+        self._recent[key] = True
+        return True
+
+
+# Failures are logged through a queue so formatting and writing stay off the request path
+_log_queue = queue.Queue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+_log_handler = _DeferredQueueHandler(_log_queue)
+_log_handler.addFilter(_RateLimitFilter())
+logger.addHandler(_log_handler)
+logger.propagate = False
+
+
+# Runs paused for approval are checkpointed here, keyed by their verification id
+CHECKPOINT_DB = "checkpoints.db"
+
+# Completed analyses are reused for a few minutes so repeat requests skip the graph;
+# concurrent requests for one city all wait on the single run in _inflight
+RESULT_CACHE_TTL = 300
+_results = TTLCache(maxsize=1024, ttl=RESULT_CACHE_TTL)
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+def _city_key(city: str) -> str:
+    return city.strip().lower()
+
+
+class _PendingVerifications(TTLCache):
+    """Verification id -> city for paused runs, bounded in size and age.
+
+    Runs nobody approves or rejects would otherwise keep their checkpoints
+    forever; evicted ids are logged and their checkpoint threads deleted.
     """
-    if state.get("needs_approval") and state.get("human_approved") is None:
-        # Route to wait node to stop execution
-        return "wait_for_approval"
-    
-    return "send_email_alert" if state.get('human_approved') else "handle_no_approval"
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for verification_id, city in expired:
+            _discard_pending(verification_id, city, "expired")
+        return expired
+
+    def popitem(self):
+        verification_id, city = super().popitem()
+        _discard_pending(verification_id, city, "evicted")
+        return verification_id, city
+
+
+PENDING_TTL = 60 * 60
+_pending = _PendingVerifications(maxsize=10_000, ttl=PENDING_TTL)
+_cleanup_tasks = set()
+
+
+def _discard_pending(verification_id: str, city: str, reason: str):
+    """Log an abandoned verification and drop its checkpoints in the background"""
+    logger.warning("Pending verification %s for %s %s without a decision", verification_id, city, reason)
+    if _APP is None:
+        return
+    try:
+        task = asyncio.get_running_loop().create_task(
+            _APP.checkpointer.adelete_thread(verification_id)
+        )
+    except RuntimeError:
+        return
+    _cleanup_tasks.add(task)
+    task.add_done_callback(_cleanup_tasks.discard)
 
 
-def get_human_verification_web(state: WeatherState) -> WeatherState:
+async def get_human_verification_web(state: WeatherState) -> WeatherState:
     """
     Web-friendly version of human verification that doesn't block.
-    Instead, it stores the state and returns a flag indicating approval is needed.
+    Low/medium severity runs are paused with `interrupt`; the checkpointer keeps
+    their state until the decision comes back through continue_with_approval.
     """
-    severity = state["severity"].strip().lower()
+    severity = state["severity"]
     
-    if severity in ["low", "medium"]:
-        # Store the state for later continuation
-        import time
-        verification_id = f"{state['city']}_{int(time.time() * 1000)}"
-        _pending_verifications[verification_id] = state
-        
-        # Mark that approval is needed
+    if severity in HUMAN_REVIEW_SEVERITIES:
+        approved = bool(interrupt({"city": state["city"], "severity": severity}))
         return {
-            **state,
-            "human_approved": None,  # None means pending
-            "verification_id": verification_id,
-            "needs_approval": True,
-            "messages": state["messages"] + [
-                SystemMessage(content="Human verification required for low/medium severity alert")
+            "human_approved": approved,
+            "messages": [
+                SystemMessage(content=f"Human verification: {'Approved' if approved else 'Rejected'}")
             ]
         }
     else:
         # Auto-approve for high/critical severity
         return {
-            **state,
             "human_approved": True,
-            "needs_approval": False,
-            "messages": state["messages"] + [
+            "messages": [
                 SystemMessage(content=f"Auto-approved {severity} severity alert")
             ]
         }
 
 
-def continue_with_approval(verification_id: str, approved: bool) -> Dict[str, Any]:
+def _build_graph() -> StateGraph:
+    """Assemble the web workflow, which pauses at human verification"""
+    workflow = StateGraph(WeatherState)
+    
+    # Add nodes
+    workflow.add_node("get_weather", get_weather_data)
+    workflow.add_node("analyze", analyze_all)
+    workflow.add_node("data_logging", data_logging)
+    workflow.add_node("emergency_response", emergency_response)
+    workflow.add_node("civil_defense_response", civil_defense_response)
+    workflow.add_node("public_works_response", public_works_response)
+    workflow.add_node("get_human_verification", get_human_verification_web)
+    workflow.add_node("send_email_alert", send_email_alert)
+    workflow.add_node("handle_no_approval", handle_no_approval)
+    
+    # Add edges
+    workflow.add_edge("get_weather", "analyze")
+    workflow.add_edge("analyze", "data_logging")
+    workflow.add_conditional_edges("data_logging", route_response)
+    workflow.add_edge("civil_defense_response", "get_human_verification")
+    workflow.add_edge("public_works_response", "get_human_verification")
+    workflow.add_edge("emergency_response", "get_human_verification")
+    workflow.add_conditional_edges("get_human_verification", verify_approval_router)
+    workflow.add_edge("send_email_alert", END)
+    workflow.add_edge("handle_no_approval", END)
+    
+    workflow.set_entry_point("get_weather")
+    return workflow
+
+
+# The graph is built once at import; it is compiled with its checkpointer on
+# first use, since the SQLite connection must be opened on the serving loop
+_GRAPH = _build_graph() if WeatherState is not None else None
+_APP = None
+_CLAIMS = None
+_sweeper = None
+_app_lock = asyncio.Lock()
+
+# How often the checkpoint database is swept for threads abandoned by any worker
+SWEEP_INTERVAL = 15 * 60
+
+
+async def _get_app():
+    """Compiled web workflow shared by every request"""
+    global _APP, _CLAIMS, _sweeper
+    async with _app_lock:
+        if _APP is None:
+            _CLAIMS = await _open_claims()
+            checkpointer = AsyncSqliteSaver(await aiosqlite.connect(CHECKPOINT_DB))
+            _APP = _GRAPH.compile(checkpointer=checkpointer)
+            _sweeper = asyncio.create_task(_sweep_periodically())
+    return _APP
+
+
+async def _open_claims() -> aiosqlite.Connection:
+    """Autocommit connection to the approval claims table in the checkpoint database"""
+    conn = await aiosqlite.connect(CHECKPOINT_DB, isolation_level=None)
+    await conn.execute(
+        "CREATE TABLE IF NOT EXISTS approval_claims ("
+        "verification_id TEXT PRIMARY KEY, claimed_at REAL NOT NULL)"
+    )
+    return conn
+
+
+async def _sweep_stale_threads():
+    """
+    Delete checkpoint threads untouched for longer than PENDING_TTL.
+    
+    _pending only expires runs paused by this process since it started; this
+    also catches runs paused before a restart or reload, runs paused on other
+    workers, and claims left by a worker that died while resuming.
+    """
+    await _CLAIMS.execute(
+        "DELETE FROM approval_claims WHERE claimed_at < ?", (time.time() - PENDING_TTL,)
+    )
+    async with _CLAIMS.execute("SELECT verification_id FROM approval_claims") as cursor:
+        resuming = {row[0] async for row in cursor}
+    
+    checkpointer = _APP.checkpointer
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=PENDING_TTL)
+    last_seen = {}
+    async for item in checkpointer.alist(None):
+        thread_id = item.config["configurable"]["thread_id"]
+        ts = datetime.fromisoformat(item.checkpoint["ts"])
+        last_seen[thread_id] = max(ts, last_seen.get(thread_id, ts))
+    
+    for thread_id, ts in last_seen.items():
+        if ts < cutoff and thread_id not in resuming:
+            logger.warning("Deleting checkpoint thread %s idle since %s", thread_id, ts.isoformat())
+            _pending.pop(thread_id, None)
+            await checkpointer.adelete_thread(thread_id)
+
+
+async def _sweep_periodically():
+    while True:
+        try:
+            await _sweep_stale_threads()
+        except Exception:
+            logger.exception("Sweeping stale checkpoint threads failed")
+        await asyncio.sleep(SWEEP_INTERVAL)
+
+
+async def shutdown():
+    """Close the checkpoint database connections, if they were opened"""
+    global _APP, _CLAIMS
+    if _APP is not None:
+        _sweeper.cancel()
+        await asyncio.gather(_sweeper, return_exceptions=True)
+        await _APP.checkpointer.conn.close()
+        await _CLAIMS.close()
+        _APP = None
+        _CLAIMS = None
+
+
+class ApprovalInProgressError(Exception):
+    """A decision for this verification is already being applied"""
+
+
+async def _claim_verification(verification_id: str) -> bool:
+    """Atomically claim a verification id for resuming, across every worker process"""
+    cursor = await _CLAIMS.execute(
+        "INSERT OR IGNORE INTO approval_claims VALUES (?, ?)", (verification_id, time.time())
+    )
+    return cursor.rowcount == 1
+
+
+async def _release_verification(verification_id: str):
+    await _CLAIMS.execute("DELETE FROM approval_claims WHERE verification_id = ?", (verification_id,))
+
+
+async def continue_with_approval(verification_id: str, approved: bool) -> Dict[str, Any]:
     """
     Continue the agent workflow with the human approval decision.
     
@@ -98,80 +300,115 @@ def continue_with_approval(verification_id: str, approved: bool) -> Dict[str, An
         
     Returns:
         Final agent result
+        
+    Raises:
+        ValueError: No run is waiting under this verification id
+        ApprovalInProgressError: Another decision for it is being applied
     """
-    if verification_id not in _pending_verifications:
-        raise ValueError(f"Verification ID {verification_id} not found")
+    app = await _get_app()
     
-    state = _pending_verifications[verification_id].copy()
-    state["human_approved"] = approved
-    state["needs_approval"] = False
+    # Claim the id in the shared database so a second decision, even one that
+    # reached another worker, can't resume the same run and send the alert twice
+    if not await _claim_verification(verification_id):
+        raise ApprovalInProgressError(f"Verification ID {verification_id} is already being processed")
     
-    # Continue from verification step - route based on approval
-    if approved:
-        final_state = send_email_alert(state)
-    else:
-        final_state = handle_no_approval(state)
-    
-    # Clean up
-    del _pending_verifications[verification_id]
-    
-    return final_state
+    try:
+        config = {"configurable": {"thread_id": verification_id}}
+        
+        # Ids paused by this process are known without touching the database; only
+        # unknown ones (paused by another worker or before a restart) need their
+        # checkpointed state loaded to confirm the run is really waiting
+        if _pending.pop(verification_id, None) is None and not (await app.aget_state(config)).next:
+            raise ValueError(f"Verification ID {verification_id} not found")
+        
+        # Resume the paused run; the graph routes to sending or skipping the email
+        final_state = await app.ainvoke(Command(resume=approved), config)
+        
+        # Clean up
+        await app.checkpointer.adelete_thread(verification_id)
+        _results.pop(_city_key(final_state["city"]), None)
+        
+        return final_state
+    finally:
+        await _release_verification(verification_id)
 
 
-def run_agent_web(city: str) -> Dict[str, Any]:
+async def run_agent_web(city: str,
+                        admission: Optional[Callable[[], AsyncContextManager]] = None) -> Dict[str, Any]:
     """
     Run the weather emergency response agent for web interface.
-    Stops before human verification if needed and returns a flag.
+    Pauses at human verification if needed and returns a flag.
+    A finished analysis of the same city from the last few minutes is returned
+    as is; runs awaiting approval and failed runs are never reused. Requests
+    arriving while the city is being analyzed share that run's result, whatever it is.
     
     Args:
         city: Name of the city to analyze
+        admission: Context manager factory held around the graph run only, so
+            cached and shared results don't take up admission slots
         
     Returns:
         dict: Structured response with a flag indicating if approval is needed
     """
+    key = _city_key(city)
+    if key in _results:
+        return dict(_results[key])
+    
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_analyze_and_cache(city, key, admission))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    
+    # Shielded so one caller disconnecting doesn't cancel the run for the others
+    return dict(await asyncio.shield(task))
+
+
+async def _analyze_and_cache(city: str, key: str,
+                             admission: Optional[Callable[[], AsyncContextManager]]) -> Dict[str, Any]:
+    if admission is None:
+        result = await _analyze_city(city)
+    else:
+        async with admission():
+            result = await _analyze_city(city)
+    if not result["needs_approval"] and not result["error"]:
+        _results[key] = result
+    return result
+
+
+def _build_response(city: str, result: Dict[str, Any], verification_id: Optional[str] = None,
+                    response: Optional[str] = None, error: Optional[str] = None) -> Dict[str, Any]:
+    """Shape a workflow state (or a partial one, on errors) into the dict returned to the API"""
+    if response is None:
+        response = format_response_plan(result) or "No response plan generated"
+    
+    return {
+        "city": result.get("city", city),
+        "weather_data": result.get("weather_data", {}),
+        "disaster_type": result.get("disaster_type", "Unknown"),
+        "severity": result.get("severity", "Unknown"),
+        "response": response,
+        "needs_approval": verification_id is not None,
+        "verification_id": verification_id,
+        "alerts": result.get("alerts", []),
+        "email_sent": result.get("email_sent", False),
+        "error": error
+    }
+
+
+async def _analyze_city(city: str) -> Dict[str, Any]:
+    """Run the web workflow for one city and shape its result for the API"""
     if WeatherState is None:
-        return {
-            "city": city,
-            "weather_data": {},
-            "disaster_type": "Error",
-            "severity": "Unknown",
-            "response": "Agent not available",
-            "needs_approval": False,
-            "verification_id": None
-        }
+        return _build_response(
+            city, {"disaster_type": "Error"}, response="Agent not available", error="Agent not available"
+        )
+    
+    # Each run gets its own checkpoint thread, which doubles as the verification id
+    verification_id = uuid.uuid4().hex
     
     try:
-        # Create web-friendly workflow
-        workflow = StateGraph(WeatherState)
-        
-        # Add nodes
-        workflow.add_node("get_weather", get_weather_data)
-        workflow.add_node("analyze_disaster", analyze_disaster_type)
-        workflow.add_node("assess_severity", assess_severity)
-        workflow.add_node("data_logging", data_logging)
-        workflow.add_node("emergency_response", emergency_response)
-        workflow.add_node("civil_defense_response", civil_defense_response)
-        workflow.add_node("public_works_response", public_works_response)
-        workflow.add_node("get_human_verification", get_human_verification_web)
-        workflow.add_node("wait_for_approval", wait_for_approval)
-        workflow.add_node("send_email_alert", send_email_alert)
-        workflow.add_node("handle_no_approval", handle_no_approval)
-        
-        # Add edges
-        workflow.add_edge("get_weather", "analyze_disaster")
-        workflow.add_edge("analyze_disaster", "assess_severity")
-        workflow.add_edge("assess_severity", "data_logging")
-        workflow.add_conditional_edges("data_logging", route_response)
-        workflow.add_edge("civil_defense_response", "get_human_verification")
-        workflow.add_edge("public_works_response", "get_human_verification")
-        workflow.add_conditional_edges("get_human_verification", verify_approval_router_web)
-        workflow.add_edge("wait_for_approval", END)  # Stop here when approval needed
-        workflow.add_edge("emergency_response", "send_email_alert")
-        workflow.add_edge("send_email_alert", END)
-        workflow.add_edge("handle_no_approval", END)
-        
-        workflow.set_entry_point("get_weather")
-        app = workflow.compile()
+        app = await _get_app()
+        config = {"configurable": {"thread_id": verification_id}}
         
         # Initialize state
         initial_state = {
@@ -179,64 +416,38 @@ def run_agent_web(city: str) -> Dict[str, Any]:
             "weather_data": {},
             "disaster_type": "",
             "severity": "",
-            "response": "",
+            "responses": [],
             "messages": [],
             "alerts": [],
             "human_approved": False,
-            "needs_approval": False,
-            "verification_id": None
+            "email_sent": False
         }
         
         # Run the workflow
-        result = app.invoke(initial_state)
+        result = await app.ainvoke(initial_state, config)
         
-        # Check if approval is needed
-        needs_approval = result.get("needs_approval", False)
-        verification_id = result.get("verification_id")
+        # If approval is needed, return early; the run stays checkpointed until resumed
+        if result.get("__interrupt__"):
+            _pending[verification_id] = city
+            return _build_response(city, result, verification_id)
         
-        # If approval is needed, return early with the current state
-        if needs_approval:
-            return {
-                "city": result.get("city", city),
-                "weather_data": result.get("weather_data", {}),
-                "disaster_type": result.get("disaster_type", "Unknown"),
-                "severity": result.get("severity", "Unknown"),
-                "response": result.get("response", ""),
-                "needs_approval": True,
-                "verification_id": verification_id,
-                "messages": [str(msg) for msg in result.get("messages", [])],
-                "alerts": result.get("alerts", [])
-            }
+        # Otherwise the run is finished and its checkpoints are no longer needed
+        await app.checkpointer.adelete_thread(verification_id)
         
-        # Otherwise, return complete result
-        return {
-            "city": result.get("city", city),
-            "weather_data": result.get("weather_data", {}),
-            "disaster_type": result.get("disaster_type", "No Immediate Threat"),
-            "severity": result.get("severity", "Low"),
-            "response": result.get("response", "No response plan generated"),
-            "needs_approval": False,
-            "verification_id": None,
-            "messages": [str(msg) for msg in result.get("messages", [])],
-            "alerts": result.get("alerts", []),
-            "email_sent": "send_email_alert" in [str(msg) for msg in result.get("messages", [])]
-        }
+        return _build_response(city, result)
         
     except Exception as e:
-        print(f"Error running agent for {city}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return {
-            "city": city,
-            "weather_data": {},
-            "disaster_type": "Analysis Error",
-            "severity": "Unknown",
-            "response": f"Error occurred during analysis: {str(e)}",
-            "needs_approval": False,
-            "verification_id": None,
-            "messages": [],
-            "alerts": []
-        }
+        logger.exception("Error running agent for %s", city)
+        # A failed run is never resumed, so drop whatever it checkpointed
+        if _APP is not None:
+            try:
+                await _APP.checkpointer.adelete_thread(verification_id)
+            except Exception:
+                logger.exception("Could not delete checkpoints of failed run %s", verification_id)
+        return _build_response(
+            city, {"disaster_type": "Analysis Error"},
+            response=f"Error occurred during analysis: {str(e)}", error=str(e)
+        )
 
 
 
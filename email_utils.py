@@ -8,6 +8,8 @@ from Agents.py or provide a standalone implementation.
 
 import os
 import smtplib
+import threading
+from typing import Optional
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
@@ -17,7 +19,59 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-def send_email(to: str, subject: str, content: str) -> bool:
+class SMTPSession:
+    """
+    SMTP connection kept open between emails
+    
+    Connects on first use. If sending over the kept connection fails (the
+    server dropped it, or closed an idle session with a 421 reply) it
+    reconnects once and retries. Safe to share between threads.
+    """
+    
+    def __init__(self, host: str = "smtp.gmail.com", port: int = 587):
+        self.host = host
+        self.port = port
+        self._server = None
+        self._lock = threading.Lock()
+    
+    def _connect(self, sender_email: str, password: str) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        try:
+            server.starttls()
+            server.login(sender_email, password)
+        except Exception:
+            server.close()
+            raise
+        return server
+    
+    def sendmail(self, sender_email: str, password: str, to: str, text: str):
+        with self._lock:
+            if self._server is not None:
+                try:
+                    self._server.sendmail(sender_email, to, text)
+                    return
+                except OSError:
+                    # SMTPException subclasses OSError, so this covers 421 replies too
+                    try:
+                        self._server.close()
+                    except OSError:
+                        pass
+                    self._server = None
+            
+            self._server = self._connect(sender_email, password)
+            self._server.sendmail(sender_email, to, text)
+    
+    def close(self):
+        with self._lock:
+            if self._server is not None:
+                try:
+                    self._server.quit()
+                except (smtplib.SMTPException, OSError):
+                    pass
+                self._server = None
+
+
+def send_email(to: str, subject: str, content: str, smtp: Optional[SMTPSession] = None) -> bool:
     """
     Send an email with the weather emergency report
     
@@ -28,6 +82,7 @@ def send_email(to: str, subject: str, content: str) -> bool:
         to: Recipient email address
         subject: Email subject line
         content: Email body content
+        smtp: Open session to send through; a one-off connection is used if omitted
         
     Returns:
         bool: True if email sent successfully, False otherwise
@@ -54,15 +109,17 @@ def send_email(to: str, subject: str, content: str) -> bool:
         body = content
         msg.attach(MIMEText(body, 'plain'))
         
-        # Connect to SMTP server and send
-        # Using Gmail SMTP (adjust for other providers)
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(sender_email, password)
-        
         text = msg.as_string()
-        server.sendmail(sender_email, to, text)
-        server.quit()
+        if smtp is not None:
+            smtp.sendmail(sender_email, password, to, text)
+        else:
+            # Connect to SMTP server and send
+            # Using Gmail SMTP (adjust for other providers)
+            server = smtplib.SMTP("smtp.gmail.com", 587)
+            server.starttls()
+            server.login(sender_email, password)
+            server.sendmail(sender_email, to, text)
+            server.quit()
         
         print(f"Email sent successfully to {to} at {datetime.now()}")
         return True
@@ -8,28 +8,86 @@ weather emergency response agent through a web interface.
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, StringConstraints
+from typing import Annotated, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
 import os
 
 # Import agent and email utilities
 try:
-    from agent_web import run_agent_web, continue_with_approval
+    from agent_web import (
+        run_agent_web, continue_with_approval, ApprovalInProgressError,
+        shutdown as shutdown_agent_web
+    )
     WEB_AGENT_AVAILABLE = True
 except ImportError:
     from agent import run_agent
     WEB_AGENT_AVAILABLE = False
-    print("Warning: agent_web not available, using basic agent (may block on terminal input)")
+    print("Warning: agent_web not available, using basic agent (low/medium alerts wait for approval typed in the server terminal)")
+
+from email_utils import send_email, SMTPSession
+
+# Default alert recipient; read after the imports above have loaded .env
+_DEFAULT_RECIPIENT = os.getenv("RECEIVER_EMAIL")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Hold long-lived connections for the lifetime of the server"""
+    app.state.smtp = SMTPSession()
+    try:
+        yield
+    finally:
+        await asyncio.to_thread(app.state.smtp.close)
+        if WEB_AGENT_AVAILABLE:
+            await shutdown_agent_web()
 
-from email_utils import send_email
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Weather Emergency Response API",
     description="API for real-time weather disaster analysis and response",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Admission control for /analyze: a bounded number of analyses run at once and
+# extra callers wait only briefly before getting a 503, so overload is pushed
+# back to the client instead of piling up as unbounded queueing latency
+MAX_CONCURRENT_ANALYSES = 16
+ADMISSION_TIMEOUT = 2.0
+SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+
+# Dedicated pool for the blocking basic agent so it can't exhaust the default executor
+EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent")
+
+
+@asynccontextmanager
+async def analysis_slot():
+    """Hold one of the analysis slots, or fail with 503 if none frees up in time"""
+    try:
+        await asyncio.wait_for(SEMAPHORE.acquire(), timeout=ADMISSION_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy analyzing other cities, please try again shortly",
+            headers={"Retry-After": "5"}
+        )
+    try:
+        yield
+    finally:
+        SEMAPHORE.release()
+
+
+# The page is static, so it is read once at startup rather than on every request
+try:
+    with open("templates/index.html", "rb") as f:
+        _INDEX_HTML = f.read()
+except FileNotFoundError:
+    _INDEX_HTML = None
+
 # Mount static files directory (for CSS if needed)
 if os.path.exists("static"):
     app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -38,7 +96,9 @@ if os.path.exists("static"):
 # Request/Response Models
 class AnalyzeRequest(BaseModel):
     """Request model for weather analysis"""
-    city: str
+    city: Annotated[str, StringConstraints(
+        strip_whitespace=True, min_length=1, max_length=64, pattern=r"^[\w\s\-\.',]+$"
+    )]
 
 
 class AnalyzeResponse(BaseModel):
@@ -81,14 +141,12 @@ async def home():
     Returns:
         HTMLResponse: The index.html template
     """
-    try:
-        with open("templates/index.html", "r", encoding="utf-8") as f:
-            return HTMLResponse(content=f.read())
-    except FileNotFoundError:
+    if _INDEX_HTML is None:
         return HTMLResponse(
             content="<h1>Error: templates/index.html not found</h1>",
             status_code=404
         )
+    return HTMLResponse(content=_INDEX_HTML)
 
 
 @app.post("/analyze", response_model=AnalyzeResponse)
@@ -106,60 +164,53 @@ async def analyze_weather(request: AnalyzeRequest):
             - Severity assessment
             - Emergency response plan
     """
-    try:
-        # Validate city name
-        if not request.city or not request.city.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="City name cannot be empty"
-            )
-        
-        city = request.city.strip()
-        
-        # Call the agent to analyze weather
-        if WEB_AGENT_AVAILABLE:
-            result = run_agent_web(city)
-        else:
-            result = run_agent(city)
-            result["needs_approval"] = False
-            result["verification_id"] = None
-        
-        # Extract relevant data from agent result
-        weather_data = result.get("weather_data", {})
-        disaster_type = result.get("disaster_type", "Unknown")
-        severity = result.get("severity", "Unknown")
-        response_plan = result.get("response", "No response plan generated")
-        needs_approval = result.get("needs_approval", False)
-        verification_id = result.get("verification_id")
-        
-        if needs_approval:
-            message = f"Human approval required for {city} - Low/Medium severity detected"
-        else:
-            message = f"Weather analysis completed for {city}"
-        
-        return AnalyzeResponse(
-            city=city,
-            weather_data=weather_data,
-            disaster_type=disaster_type,
-            severity=severity,
-            response=response_plan,
-            success=True,
-            message=message,
-            needs_approval=needs_approval,
-            verification_id=verification_id
-        )
-        
-    except Exception as e:
-        # Handle errors gracefully
-        return AnalyzeResponse(
-            city=request.city,
-            weather_data={},
-            disaster_type="Error",
-            severity="Unknown",
-            response="",
-            success=False,
-            message=f"Error analyzing weather: {str(e)}"
+    # The city name was already validated and stripped by AnalyzeRequest
+    city = request.city
+    
+    # Call the agent to analyze weather
+    if WEB_AGENT_AVAILABLE:
+        # Only a request that actually runs the graph takes a slot; cached results
+        # and requests joining a run already in flight for the city don't
+        result = await run_agent_web(city, admission=analysis_slot)
+    else:
+        async with analysis_slot():
+            # The basic agent drives its own event loop, so keep it off ours
+            result = await asyncio.get_running_loop().run_in_executor(EXECUTOR, run_agent, city)
+        result["needs_approval"] = False
+        result["verification_id"] = None
+    
+    # The agent reports its own failures; surface them as a bad gateway
+    if result.get("error"):
+        raise HTTPException(
+            status_code=502,
+            detail=f"Error analyzing weather: {result['error']}"
         )
+    
+    # Extract relevant data from agent result
+    weather_data = result.get("weather_data", {})
+    disaster_type = result.get("disaster_type", "Unknown")
+    severity = result.get("severity", "Unknown")
+    response_plan = result.get("response", "No response plan generated")
+    needs_approval = result.get("needs_approval", False)
+    verification_id = result.get("verification_id")
+    
+    if needs_approval:
+        message = f"Human approval required for {city} - Low/Medium severity detected"
+    else:
+        message = f"Weather analysis completed for {city}"
+    
+    # Built from the agent's own state, so skip re-validating it
+    return AnalyzeResponse.model_construct(
+        city=city,
+        weather_data=weather_data,
+        disaster_type=disaster_type,
+        severity=severity,
+        response=response_plan,
+        success=True,
+        message=message,
+        needs_approval=needs_approval,
+        verification_id=verification_id
+    )
 
 
 @app.post("/send_email", response_model=EmailResponse)
@@ -186,7 +237,7 @@ async def send_email_report(request: EmailRequest):
         content = request.report_text
         
         # Use recipient from request or default from environment
-        recipient = request.recipient_email or os.getenv("RECEIVER_EMAIL")
+        recipient = request.recipient_email or _DEFAULT_RECIPIENT
         
         if not recipient:
             raise HTTPException(
@@ -194,8 +245,8 @@ async def send_email_report(request: EmailRequest):
                 detail="Recipient email not provided and RECEIVER_EMAIL not set in environment"
             )
         
-        # Send email using email utility
-        success = send_email(recipient, subject, content)
+        # Send email using email utility; SMTP blocks, so keep it off the event loop
+        success = await asyncio.to_thread(send_email, recipient, subject, content, app.state.smtp)
         
         if success:
             return EmailResponse(
@@ -239,10 +290,10 @@ async def handle_approval(request: ApprovalRequest):
             )
         
         # Continue the workflow with the approval decision
-        result = continue_with_approval(request.verification_id, request.approved)
+        result = await continue_with_approval(request.verification_id, request.approved)
         
         # Extract relevant data
-        email_sent = "send_email_alert" in [str(msg) for msg in result.get("messages", [])]
+        email_sent = result.get("email_sent", False)
         
         if request.approved and email_sent:
             message = "✅ Email alert sent successfully!"
@@ -258,6 +309,14 @@ async def handle_approval(request: ApprovalRequest):
             "city": result.get("city", "Unknown")
         }
         
+    except ApprovalInProgressError as e:
+        return JSONResponse(
+            status_code=409,
+            content={
+                "success": False,
+                "message": str(e)
+            }
+        )
     except ValueError as e:
         return JSONResponse(
             status_code=404,
@@ -294,5 +353,20 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # DEV=1 runs a single auto-reloading process; otherwise WEB_WORKERS processes.
+    # "auto" picks uvloop and httptools, which come with uvicorn[standard]
+    dev = os.getenv("DEV") == "1"
+    workers = None if dev else int(os.getenv("WEB_WORKERS", "4"))
+    if workers and workers > 1:
+        # Each worker rotates its own disaster log; they can't share one file
+        os.environ.setdefault("DISASTER_LOG_FILE", "disaster_log.{pid}.jsonl")
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=workers,
+        loop="auto",
+        http="auto",
+        reload=dev
+    )
 